@@ -1,134 +1,145 @@
 """
 Document upload and processing endpoints
 """
-from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, BackgroundTasks
-from sqlalchemy.orm import Session
-from typing import List
+from fastapi import APIRouter, UploadFile, File, Depends, HTTPException, Request, Response
+from sqlalchemy import and_, case, func, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from typing import BinaryIO, List, Optional, Tuple
+import asyncio
+import hashlib
+from datetime import datetime, timezone
 import os
 import shutil
+import tempfile
+import uuid
 from pathlib import Path
+from fastapi_cache.decorator import cache
 
-from app.core.database import get_db
+from app.core.database import get_async_db, AsyncSessionLocal
 from app.core.config import settings
+from app.core.cache import DOCUMENTS_NAMESPACE, clear_cache_namespace_async
 from app.models.document import Document
-from app.services.document_processor import DocumentProcessor
 from app.schemas.document import DocumentResponse, DocumentList
+from app.tasks.documents import process_document_task
 
 router = APIRouter()
 
+# 上传文件分块写盘的块大小（字节）
+UPLOAD_CHUNK_SIZE = 1 << 20
+# Content-Length 包含 multipart 边界和表单头，按文件大小上限比较时留出余量
+MULTIPART_OVERHEAD = 64 * 1024
+
+def _save_upload(src: BinaryIO, filename: str) -> Optional[Tuple[Path, int, str]]:
+    """Copy an upload to disk and hash it; returns (path, size, sha256) or None if it exceeds MAX_UPLOAD_SIZE"""
+    # 整个拷贝在一个线程中完成，readinto 复用同一块缓冲区，不为每个分块分配新的 bytes
+    buffer = bytearray(UPLOAD_CHUNK_SIZE)
+    view = memoryview(buffer)
+    file_hash = hashlib.sha256()
+    file_size = 0
+    # 先写入上传目录内的临时文件：超限或出错时只删除临时文件，不会截断或删除同名的已有文档
+    with tempfile.NamedTemporaryFile(dir=settings.UPLOAD_DIR, suffix=".part", delete=False) as f:
+        temp_path = Path(f.name)
+        try:
+            while read := src.readinto(buffer):
+                file_size += read
+                if file_size > settings.MAX_UPLOAD_SIZE:
+                    break
+                file_hash.update(view[:read])
+                f.write(view[:read])
+        except BaseException:
+            temp_path.unlink(missing_ok=True)
+            raise
+    
+    if file_size > settings.MAX_UPLOAD_SIZE:
+        temp_path.unlink(missing_ok=True)
+        return None
+    
+    # 文件名加唯一前缀，不同目录下的同名文件或重复上传互不覆盖
+    file_path = settings.UPLOAD_DIR / f"{uuid.uuid4().hex}_{filename}"
+    os.replace(temp_path, file_path)
+    return file_path, file_size, file_hash.hexdigest()
+
 @router.post("/upload", response_model=DocumentResponse)
 async def upload_document(
-    background_tasks: BackgroundTasks,
+    request: Request,
     file: UploadFile = File(...),
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Upload and process a document"""
     
+    # 只取文件名本身，防止 "../" 或绝对路径写到上传目录之外
+    filename = os.path.basename((file.filename or "").replace("\\", "/"))
+    if filename in ("", ".", ".."):
+        raise HTTPException(400, "Invalid file name")
+    
     # Validate file type
-    file_extension = file.filename.split('.')[-1].lower()
+    file_extension = os.path.splitext(filename)[1][1:].lower()
     if file_extension not in settings.ALLOWED_EXTENSIONS:
         raise HTTPException(400, f"File type {file_extension} not allowed")
     
-    # Validate file size
-    file_size = 0
-    content = await file.read()
-    file_size = len(content)
-    
-    if file_size > settings.MAX_UPLOAD_SIZE:
-        raise HTTPException(400, f"File size exceeds maximum of {settings.MAX_UPLOAD_SIZE} bytes")
-    
-    # Save file
-    upload_dir = settings.UPLOAD_DIR
-    upload_dir.mkdir(exist_ok=True)
+    # 声明的请求体已明显超限时直接拒绝，不再写盘
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > settings.MAX_UPLOAD_SIZE + MULTIPART_OVERHEAD:
+        raise HTTPException(413, f"File size exceeds maximum of {settings.MAX_UPLOAD_SIZE} bytes")
     
-    file_path = upload_dir / file.filename
-    with open(file_path, 'wb') as f:
-        f.write(content)
+    # Save file, validating size as it streams in
+    # 上传目录在加载配置时已创建；分块写入，内存占用与文件大小无关，超限立即中止
+    # 边写边算哈希，后台处理时无需再读一遍文件
+    saved = await asyncio.to_thread(_save_upload, file.file, filename)
+    if saved is None:
+        raise HTTPException(413, f"File size exceeds maximum of {settings.MAX_UPLOAD_SIZE} bytes")
+    file_path, file_size, file_hash = saved
     
     # Create database record
     document = Document(
-        filename=file.filename,
+        filename=filename,
         file_type=file_extension,
         file_path=str(file_path),
         file_size=file_size,
+        content_hash=file_hash,
         status="uploaded",
         owner_id=1  # TODO: Get from authenticated user
     )
     
     db.add(document)
-    db.commit()
-    db.refresh(document)
+    await db.commit()
+    await clear_cache_namespace_async(DOCUMENTS_NAMESPACE)
     
-    # Process document in background
-    background_tasks.add_task(process_document_task, document.id, str(file_path), file_extension)
+    # 文档解析交给Celery worker执行，API进程立即返回
+    process_document_task.delay(document.id, str(file_path), file_extension, document.content_hash)
     
     return DocumentResponse.model_validate(document)
 
-def process_document_task(document_id: int, file_path: str, file_type: str):
-    """Background task to process document"""
-    from app.core.database import SessionLocal
-    from sqlalchemy.sql import func
-    
-    db = SessionLocal()
-    try:
-        # Get document
-        document = db.query(Document).filter(Document.id == document_id).first()
-        if not document:
-            return
-        
-        # Update status and start time
-        document.status = "processing"
-        document.processing_started_at = func.now()
-        db.commit()
-        
-        # Process document
-        processor = DocumentProcessor()
-        result = processor.process_document(file_path, file_type)
-        
-        if result.get('success'):
-            document.raw_content = result.get('content', '')
-            document.processed_content = result.get('content', '')
-            document.metadata = str(result.get('metadata', {}))
-            document.content_hash = result.get('file_hash', '')
-            document.status = "processed"
-            document.processing_completed_at = func.now()
-        else:
-            document.status = "failed"
-            document.error_message = result.get('error', 'Unknown error')
-            document.retry_count += 1
-            document.processing_completed_at = func.now()
-        
-        db.commit()
-        
-    except Exception as e:
-        document.status = "failed"
-        document.error_message = str(e)
-        document.retry_count += 1
-        document.processing_completed_at = func.now()
-        db.commit()
-    finally:
-        db.close()
-
 @router.get("/stats")
-async def get_document_stats(db: Session = Depends(get_db)):
+async def get_document_stats():
     """Get document statistics"""
-    from sqlalchemy import func
-    
-    # 总文档数
-    total_documents = db.query(Document).count()
-    
-    # 各状态文档数
-    processed_documents = db.query(Document).filter(Document.status == "processed").count()
-    failed_documents = db.query(Document).filter(Document.status == "failed").count()
-    
-    # 总文件大小
-    total_size = db.query(func.sum(Document.file_size)).scalar() or 0
-    
-    # 文件类型分布
-    file_type_distribution = db.query(
-        Document.file_type.label('type'),
-        func.count(Document.id).label('count')
-    ).group_by(Document.file_type).all()
+    if not settings.STATS_CACHE_TTL:
+        return await _build_document_stats()
+    return await _get_document_stats_cached()
+
+@cache(expire=settings.STATS_CACHE_TTL, namespace=DOCUMENTS_NAMESPACE)
+async def _get_document_stats_cached():
+    """Document statistics cached in Redis; invalidated when documents change"""
+    return await _build_document_stats()
+
+async def _build_document_stats():
+    """Build document statistics"""
+    async with AsyncSessionLocal() as db:
+        # 总文档数、各状态文档数与总文件大小，一次聚合查询完成
+        result = await db.execute(select(
+            func.count(Document.id),
+            func.coalesce(func.sum(case((Document.status == "processed", 1), else_=0)), 0),
+            func.coalesce(func.sum(case((Document.status == "failed", 1), else_=0)), 0),
+            func.coalesce(func.sum(Document.file_size), 0)
+        ))
+        total_documents, processed_documents, failed_documents, total_size = result.one()
+        
+        # 文件类型分布
+        result = await db.execute(select(
+            Document.file_type.label('type'),
+            func.count(Document.id).label('count')
+        ).group_by(Document.file_type))
+        file_type_distribution = result.all()
     
     return {
         "total_documents": total_documents,
@@ -140,26 +151,41 @@ async def get_document_stats(db: Session = Depends(get_db)):
 
 @router.get("/", response_model=List[DocumentList])
 async def list_documents(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
-    db: Session = Depends(get_db)
+    cursor: Optional[int] = None,
+    db: AsyncSession = Depends(get_async_db)
 ):
-    """List all documents"""
-    documents = db.query(Document).filter(
-        Document.is_deleted.is_(False)
-    ).offset(skip).limit(limit).all()
+    """
+    List documents, newest first
+    
+    When more rows exist, the ``X-Next-Cursor`` response header holds the
+    value to pass as ``cursor`` for the next page (keyset paging, no OFFSET).
+    """
+    query = select(Document).where(Document.is_deleted.is_(False))
+    if cursor is not None:
+        query = query.where(Document.id < cursor)
+    else:
+        query = query.offset(skip)
+    # 多取一行用于判断是否还有下一页
+    result = await db.scalars(query.order_by(Document.id.desc()).limit(limit + 1))
+    documents = result.all()
+    if len(documents) > limit:
+        documents = documents[:limit]
+        response.headers["X-Next-Cursor"] = str(documents[-1].id)
     return documents
 
 @router.get("/{document_id}", response_model=DocumentResponse)
 async def get_document(
     document_id: int,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get document details"""
-    document = db.query(Document).filter(
+    document = await db.scalar(select(Document).where(
         Document.id == document_id,
         Document.is_deleted.is_(False)
-    ).first()
+    ))
     if not document:
         raise HTTPException(404, "Document not found")
     return document
@@ -168,13 +194,13 @@ async def get_document(
 async def delete_document(
     document_id: int,
     force: bool = False,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Delete a document (soft delete by default)"""
-    document = db.query(Document).filter(
+    document = await db.scalar(select(Document).where(
         Document.id == document_id,
         Document.is_deleted.is_(False)
-    ).first()
+    ))
     if not document:
         raise HTTPException(404, "Document not found")
     
@@ -182,28 +208,27 @@ async def delete_document(
         # Hard delete - remove file and database record
         if document.file_path and os.path.exists(document.file_path):
             os.remove(document.file_path)
-        db.delete(document)
+        await db.delete(document)
     else:
         # Soft delete - mark as deleted
-        from sqlalchemy.sql import func
         document.is_deleted = True
-        document.deleted_at = func.now()
+        document.deleted_at = datetime.now(timezone.utc)
     
-    db.commit()
+    await db.commit()
+    await clear_cache_namespace_async(DOCUMENTS_NAMESPACE)
     
     return {"message": "Document deleted successfully"}
 
 @router.post("/{document_id}/retry")
 async def retry_document_processing(
     document_id: int,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Retry processing a failed document"""
-    document = db.query(Document).filter(
+    document = await db.scalar(select(Document).where(
         Document.id == document_id,
         Document.is_deleted.is_(False)
-    ).first()
+    ))
     if not document:
         raise HTTPException(404, "Document not found")
     
@@ -213,33 +238,26 @@ async def retry_document_processing(
     # Reset document status
     document.status = "uploaded"
     document.error_message = None
-    db.commit()
+    await db.commit()
+    await clear_cache_namespace_async(DOCUMENTS_NAMESPACE)
     
-    # Process document in background
-    background_tasks.add_task(process_document_task, document.id, document.file_path, document.file_type)
+    # 文档解析交给Celery worker执行
+    process_document_task.delay(document.id, document.file_path, document.file_type, document.content_hash)
     
     return {"message": "Document retry initiated"}
 
 @router.get("/management/status")
-async def get_processing_status(db: Session = Depends(get_db)):
+async def get_processing_status(db: AsyncSession = Depends(get_async_db)):
     """Get current processing status and queue info"""
-    from sqlalchemy import func, case
-    
     # Document counts by status
-    status_counts = db.query(
+    result = await db.execute(select(
         Document.status.label('status'),
         func.count(Document.id).label('count')
-    ).filter(Document.is_deleted.is_(False)).group_by(Document.status).all()
-    
-    # Failed documents that can be retried
-    retryable_count = db.query(Document).filter(
-        Document.status == "failed",
-        Document.retry_count < Document.max_retries,
-        Document.is_deleted.is_(False)
-    ).count()
+    ).where(Document.is_deleted.is_(False)).group_by(Document.status))
+    status_counts = result.all()
     
-    # Processing time statistics
-    processing_stats = db.query(
+    # 可重试数量与平均处理时长，一次聚合查询完成；处理中数量直接取自上面的状态统计
+    result = await db.execute(select(
         func.avg(
             case(
                 (Document.processing_completed_at.is_not(None),
@@ -247,28 +265,30 @@ async def get_processing_status(db: Session = Depends(get_db)):
             )
         ).label('avg_processing_time'),
         func.count(
-            case((Document.status == "processing", 1))
-        ).label('currently_processing')
-    ).filter(Document.is_deleted.is_(False)).first()
+            case((and_(Document.status == "failed", Document.retry_count < Document.max_retries), 1))
+        ).label('retryable_documents')
+    ).where(Document.is_deleted.is_(False)))
+    processing_stats = result.one()
     
     return {
         "status_counts": [{"status": item.status, "count": item.count} for item in status_counts],
-        "retryable_documents": retryable_count,
+        "retryable_documents": processing_stats.retryable_documents,
         "avg_processing_time_seconds": processing_stats.avg_processing_time or 0,
-        "currently_processing": processing_stats.currently_processing or 0
+        "currently_processing": next((item.count for item in status_counts if item.status == "processing"), 0)
     }
 
 @router.get("/management/failed")
 async def get_failed_documents(
     skip: int = 0,
     limit: int = 50,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_async_db)
 ):
     """Get list of failed documents with retry info"""
-    documents = db.query(Document).filter(
+    result = await db.scalars(select(Document).where(
         Document.status == "failed",
         Document.is_deleted.is_(False)
-    ).order_by(Document.updated_at.desc()).offset(skip).limit(limit).all()
+    ).order_by(Document.updated_at.desc()).offset(skip).limit(limit))
+    documents = result.all()
     
     return [{
         "id": doc.id,
@@ -282,26 +302,33 @@ async def get_failed_documents(
     } for doc in documents]
 
 @router.post("/management/cleanup-timeouts")
-async def cleanup_timeout_documents(db: Session = Depends(get_db)):
+async def cleanup_timeout_documents(db: AsyncSession = Depends(get_async_db)):
     """Mark timed-out processing documents as failed"""
-    from sqlalchemy.sql import func
-    
     timeout_threshold = func.now() - func.make_interval(mins=30)
     
-    timed_out_docs = db.query(Document).filter(
-        Document.status == "processing",
-        Document.processing_started_at < timeout_threshold,
-        Document.is_deleted.is_(False)
-    ).all()
-    
-    for doc in timed_out_docs:
-        doc.status = "failed"
-        doc.error_message = "Processing timeout (30 minutes)"
-        doc.processing_completed_at = func.now()
+    # 单条 UPDATE ... RETURNING，不加载文档对象，也不逐行更新
+    result = await db.scalars(
+        update(Document)
+        .where(
+            Document.status == "processing",
+            Document.processing_started_at < timeout_threshold,
+            Document.is_deleted.is_(False)
+        )
+        .values(
+            status="failed",
+            error_message="Processing timeout (30 minutes)",
+            processing_completed_at=func.now()
+        )
+        .returning(Document.id),
+        execution_options={"synchronize_session": False}
+    )
+    document_ids = result.all()
     
-    db.commit()
+    await db.commit()
+    if document_ids:
+        await clear_cache_namespace_async(DOCUMENTS_NAMESPACE)
     
     return {
-        "message": f"Cleaned up {len(timed_out_docs)} timed-out documents",
-        "document_ids": [doc.id for doc in timed_out_docs]
+        "message": f"Cleaned up {len(document_ids)} timed-out documents",
+        "document_ids": document_ids
     }
\ No newline at end of file
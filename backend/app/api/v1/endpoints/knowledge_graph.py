@@ -1,102 +1,126 @@
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import ORJSONResponse
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.core.database import get_async_db
 from app.models.course import Course, Chapter, Section, KnowledgePoint
-from app.services.llm_service import LLMService
-from sqlalchemy.orm import selectinload
+from sqlalchemy.orm import selectinload, undefer
 from sqlalchemy import select
 from typing import List, Dict, Any
+import json
 import logging
 
 logger = logging.getLogger(__name__)
 
 router = APIRouter()
 
-@router.get("/{course_id}")
+@router.get("/{course_id}", response_class=ORJSONResponse)
 async def get_knowledge_graph(course_id: int, db: AsyncSession = Depends(get_async_db)):
     """Get knowledge graph for a course"""
     try:
-        # Query course with all related data
-        query = select(Course).options(
-            selectinload(Course.chapters).selectinload(Chapter.sections).selectinload(Section.knowledge_points)
-        ).where(Course.id == course_id)
-        result = await db.execute(query)
-        course = result.scalar_one_or_none()
+        # 只取图谱需要的列，不构造ORM对象：课程一行，章节/小节/知识点展开成一次有序的外连接
+        result = await db.execute(
+            select(Course.id, Course.title, Course.description).where(Course.id == course_id)
+        )
+        course = result.one_or_none()
         
         if not course:
             raise HTTPException(status_code=404, detail="Course not found")
+        
+        result = await db.execute(
+            select(
+                Chapter.id.label("chapter_id"),
+                Chapter.title.label("chapter_title"),
+                Chapter.description.label("chapter_description"),
+                Section.id.label("section_id"),
+                Section.title.label("section_title"),
+                Section.description.label("section_description"),
+                KnowledgePoint.id.label("point_id"),
+                KnowledgePoint.title.label("point_title"),
+                KnowledgePoint.description.label("point_description")
+            )
+            .outerjoin(Chapter.sections)
+            .outerjoin(Section.knowledge_points)
+            .where(Chapter.course_id == course_id)
+            .order_by(Chapter.chapter_number, Section.section_number, KnowledgePoint.point_id)
+        )
+        rows = result.all()
             
         # Build knowledge graph from course data
         nodes = []
         edges = []
         
         # Add course node
+        course_node_id = f"course_{course.id}"
         nodes.append({
-            "id": f"course_{course.id}",
+            "id": course_node_id,
             "label": course.title,
             "type": "course",
             "level": 0,
             "description": course.description
         })
         
-        # Add chapter nodes
-        for chapter in course.chapters:
-            chapter_id = f"chapter_{chapter.id}"
-            nodes.append({
-                "id": chapter_id,
-                "label": chapter.title,
-                "type": "chapter",
-                "level": 1,
-                "description": chapter.description
-            })
-            
-            # Add edge from course to chapter
-            edges.append({
-                "from": f"course_{course.id}",
-                "to": chapter_id,
-                "relationship": "contains",
-                "label": "包含"
-            })
+        # 同一章节/小节在多行中重复出现，只在首次出现时生成节点
+        seen_chapters = set()
+        seen_sections = set()
+        for row in rows:
+            chapter_id = f"chapter_{row.chapter_id}"
+            if row.chapter_id not in seen_chapters:
+                seen_chapters.add(row.chapter_id)
+                # Add chapter node and edge from course to chapter
+                nodes.append({
+                    "id": chapter_id,
+                    "label": row.chapter_title,
+                    "type": "chapter",
+                    "level": 1,
+                    "description": row.chapter_description
+                })
+                edges.append({
+                    "from": course_node_id,
+                    "to": chapter_id,
+                    "relationship": "contains",
+                    "label": "包含"
+                })
             
-            # Add section nodes
-            for section in chapter.sections:
-                section_id = f"section_{section.id}"
+            if row.section_id is None:
+                continue
+            section_id = f"section_{row.section_id}"
+            if row.section_id not in seen_sections:
+                seen_sections.add(row.section_id)
+                # Add section node and edge from chapter to section
                 nodes.append({
                     "id": section_id,
-                    "label": section.title,
+                    "label": row.section_title,
                     "type": "topic",
                     "level": 2,
-                    "description": section.description
+                    "description": row.section_description
                 })
-                
-                # Add edge from chapter to section
                 edges.append({
                     "from": chapter_id,
                     "to": section_id,
                     "relationship": "contains",
                     "label": "包含"
                 })
-                
-                # Add knowledge point nodes
-                for point in section.knowledge_points:
-                    point_id = f"point_{point.id}"
-                    nodes.append({
-                        "id": point_id,
-                        "label": point.title,
-                        "type": "concept",
-                        "level": 3,
-                        "description": point.description
-                    })
-                    
-                    # Add edge from section to knowledge point
-                    edges.append({
-                        "from": section_id,
-                        "to": point_id,
-                        "relationship": "contains",
-                        "label": "包含"
-                    })
-        
-        return {"nodes": nodes, "edges": edges}
+            
+            if row.point_id is None:
+                continue
+            # Add knowledge point node and edge from section to knowledge point
+            point_id = f"point_{row.point_id}"
+            nodes.append({
+                "id": point_id,
+                "label": row.point_title,
+                "type": "concept",
+                "level": 3,
+                "description": row.point_description
+            })
+            edges.append({
+                "from": section_id,
+                "to": point_id,
+                "relationship": "contains",
+                "label": "包含"
+            })
+        
+        # 大课程的图谱有上万个节点和边，直接用 orjson 编码，跳过 jsonable_encoder 的逐项遍历
+        return ORJSONResponse({"nodes": nodes, "edges": edges})
         
     except Exception as e:
         logger.error(f"Failed to get knowledge graph for course {course_id}: {str(e)}")
@@ -106,19 +130,18 @@ async def get_knowledge_graph(course_id: int, db: AsyncSession = Depends(get_asy
 async def generate_knowledge_graph(course_id: int, db: AsyncSession = Depends(get_async_db)):
     """Generate knowledge graph using AI"""
     try:
-        # Query course with all related data
-        query = select(Course).options(
-            selectinload(Course.chapters).selectinload(Chapter.sections).selectinload(Section.knowledge_points)
-        ).where(Course.id == course_id)
-        result = await db.execute(query)
-        course = result.scalar_one_or_none()
+        # Use LLM service to generate enhanced knowledge graph
+        from app.services.llm_service import get_llm_service, KNOWLEDGE_GRAPH_CONTENT_CHARS
+        llm_service = get_llm_service()
+        
+        result = await db.execute(
+            select(Course.title, Course.description).where(Course.id == course_id)
+        )
+        course = result.one_or_none()
         
         if not course:
             raise HTTPException(status_code=404, detail="Course not found")
         
-        # Use LLM service to generate enhanced knowledge graph
-        llm_service = LLMService()
-        
         # Prepare course content for analysis
         course_content = {
             "title": course.title,
@@ -126,7 +149,23 @@ async def generate_knowledge_graph(course_id: int, db: AsyncSession = Depends(ge
             "chapters": []
         }
         
-        for chapter in course.chapters:
+        # 提示词只使用课程内容JSON的前KNOWLEDGE_GRAPH_CONTENT_CHARS个字符：
+        # 按章节分批流式读取，已收集的内容足以填满这一前缀后就停止，不再加载整门课程
+        content_chars = len(json.dumps(course_content, ensure_ascii=False, indent=2))
+        chapters = await db.stream_scalars(
+            select(Chapter)
+            .where(Chapter.course_id == course_id)
+            .order_by(Chapter.chapter_number)
+            .options(
+                selectinload(Chapter.sections).options(
+                    undefer(Section.content),
+                    selectinload(Section.knowledge_points)
+                )
+            )
+            .execution_options(yield_per=20)
+        )
+        
+        async for chapter in chapters:
             chapter_data = {
                 "title": chapter.title,
                 "description": chapter.description,
@@ -150,6 +189,11 @@ async def generate_knowledge_graph(course_id: int, db: AsyncSession = Depends(ge
                 chapter_data["sections"].append(section_data)
             
             course_content["chapters"].append(chapter_data)
+            # 嵌套后缩进更深，单独序列化的长度偏小，因此停止时前缀一定已完整
+            content_chars += len(json.dumps(chapter_data, ensure_ascii=False, indent=2))
+            if content_chars > KNOWLEDGE_GRAPH_CONTENT_CHARS:
+                break
+        await chapters.close()
         
         # Generate enhanced knowledge graph with AI
         enhanced_graph = await llm_service.generate_knowledge_graph(course_content)
@@ -1,15 +1,23 @@
 """
 WebSocket endpoints for real-time updates
 """
-import json
 import logging
 from typing import Dict, Set
 from fastapi import APIRouter, WebSocket, WebSocketDisconnect
 from fastapi.websockets import WebSocketState
+from redis import asyncio as aioredis
 import asyncio
+import time
+import orjson
+
+from app.core.config import settings
+from app.core.database import redis_client
 
 logger = logging.getLogger(__name__)
 
+# 课程生成运行在Celery worker中，进度消息经Redis频道转发到持有WebSocket连接的API进程
+TASK_UPDATES_CHANNEL = "task-updates:"
+
 router = APIRouter()
 
 class ConnectionManager:
@@ -35,31 +43,64 @@ class ConnectionManager:
         if websocket.client_state == WebSocketState.CONNECTED:
             await websocket.send_text(message)
     
-    async def broadcast_to_task(self, message: dict, task_id: str):
-        """向特定任务的所有连接广播消息"""
+    async def send_text_to_task(self, message_str: str, task_id: str):
+        """向特定任务的所有连接发送已序列化的JSON文本"""
         if task_id not in self.active_connections:
             return
         
-        message_str = json.dumps(message, ensure_ascii=False)
         disconnected = set()
-        
+        connections = []
         for connection in self.active_connections[task_id].copy():
-            try:
-                if connection.client_state == WebSocketState.CONNECTED:
-                    await connection.send_text(message_str)
-                else:
-                    disconnected.add(connection)
-            except Exception as e:
-                logger.error(f"Error sending message to WebSocket: {e}")
+            if connection.client_state == WebSocketState.CONNECTED:
+                connections.append(connection)
+            else:
+                disconnected.add(connection)
+        
+        # 并发发送，广播耗时取决于最慢的连接而不是连接数
+        results = await asyncio.gather(
+            *(connection.send_text(message_str) for connection in connections),
+            return_exceptions=True
+        )
+        for connection, result in zip(connections, results):
+            if isinstance(result, Exception):
+                logger.error(f"Error sending message to WebSocket: {result}")
                 disconnected.add(connection)
         
-        # 清理断开的连接
-        for conn in disconnected:
-            self.active_connections[task_id].discard(conn)
+        # 清理断开的连接；等待发送期间该任务的连接可能已全部断开
+        connections_for_task = self.active_connections.get(task_id)
+        if connections_for_task is not None:
+            for conn in disconnected:
+                connections_for_task.discard(conn)
 
 # 全局连接管理器
 manager = ConnectionManager()
 
+def publish_task_update(update: dict, task_id: str):
+    """发布任务更新到Redis，由API进程中的relay_task_updates转发给WebSocket客户端"""
+    redis_client.publish(f"{TASK_UPDATES_CHANNEL}{task_id}", orjson.dumps(update))
+
+async def relay_task_updates():
+    """订阅worker发布的任务更新并广播到本进程的WebSocket连接，随应用生命周期运行"""
+    while True:
+        client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
+        pubsub = client.pubsub()
+        try:
+            await pubsub.psubscribe(f"{TASK_UPDATES_CHANNEL}*")
+            async for message in pubsub.listen():
+                if message["type"] != "pmessage":
+                    continue
+                task_id = message["channel"][len(TASK_UPDATES_CHANNEL):]
+                # 消息在worker中已序列化为JSON，原样转发，不再解析和重新编码
+                await manager.send_text_to_task(message["data"], task_id)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error(f"Task update relay error: {e}")
+            await asyncio.sleep(1)
+        finally:
+            await pubsub.aclose()
+            await client.aclose()
+
 @router.websocket("/course-generation/{task_id}")
 async def websocket_course_generation(websocket: WebSocket, task_id: str):
     """
@@ -68,22 +109,17 @@ async def websocket_course_generation(websocket: WebSocket, task_id: str):
     """
     await manager.connect(websocket, task_id)
     try:
+        # 阻塞等待客户端消息，断开时抛出WebSocketDisconnect；
+        # 死连接由uvicorn的协议层ping（--ws-ping-interval）检测，无需定时轮询
         while True:
-            # 保持连接活跃，接收客户端的ping消息
-            try:
-                data = await asyncio.wait_for(websocket.receive_text(), timeout=1.0)
-                if data == "ping":
-                    await websocket.send_text("pong")
-            except asyncio.TimeoutError:
-                # 超时是正常的，继续保持连接
-                continue
-            except Exception as e:
-                logger.error(f"WebSocket receive error: {e}")
-                break
+            data = await websocket.receive_text()
+            if data == "ping":
+                await websocket.send_text("pong")
     except WebSocketDisconnect:
-        manager.disconnect(websocket, task_id)
+        pass
     except Exception as e:
         logger.error(f"WebSocket error: {e}")
+    finally:
         manager.disconnect(websocket, task_id)
 
 async def send_progress_update(task_id: str, step: str, progress: int, message: str, data: dict = None):
@@ -103,14 +139,14 @@ async def send_progress_update(task_id: str, step: str, progress: int, message:
         "step": step,
         "progress": progress,
         "message": message,
-        "timestamp": asyncio.get_event_loop().time()
+        "timestamp": time.monotonic()
     }
     
     if data:
         update["data"] = data
     
-    await manager.broadcast_to_task(update, task_id)
-    logger.info(f"Sent progress update for task {task_id}: {step} ({progress}%) - {message}")
+    publish_task_update(update, task_id)
+    logger.debug("Sent progress update for task %s: %s (%s%%) - %s", task_id, step, progress, message)
 
 async def send_completion_update(task_id: str, success: bool, message: str, course_id: int = None):
     """
@@ -127,14 +163,14 @@ async def send_completion_update(task_id: str, success: bool, message: str, cour
         "task_id": task_id,
         "success": success,
         "message": message,
-        "timestamp": asyncio.get_event_loop().time()
+        "timestamp": time.monotonic()
     }
     
     if course_id:
         update["course_id"] = course_id
     
-    await manager.broadcast_to_task(update, task_id)
-    logger.info(f"Sent completion update for task {task_id}: {'SUCCESS' if success else 'FAILED'} - {message}")
+    publish_task_update(update, task_id)
+    logger.debug("Sent completion update for task %s: %s - %s", task_id, "SUCCESS" if success else "FAILED", message)
 
 async def send_error_update(task_id: str, error_message: str, step: str = None):
     """
@@ -149,11 +185,11 @@ async def send_error_update(task_id: str, error_message: str, step: str = None):
         "type": "error",
         "task_id": task_id,
         "message": error_message,
-        "timestamp": asyncio.get_event_loop().time()
+        "timestamp": time.monotonic()
     }
     
     if step:
         update["step"] = step
     
-    await manager.broadcast_to_task(update, task_id)
+    publish_task_update(update, task_id)
     logger.error(f"Sent error update for task {task_id}: {error_message}")
\ No newline at end of file
@@ -0,0 +1,54 @@
+"""
+Redis-backed response caching (fastapi-cache2)
+"""
+import hashlib
+from typing import Any, Callable, Optional
+
+from fastapi_cache import FastAPICache
+from fastapi_cache.backends.redis import RedisBackend
+from redis import asyncio as aioredis
+from starlette.requests import Request
+from starlette.responses import Response
+
+from app.core.config import settings
+from app.core.database import async_redis_client, redis_client
+
+CACHE_PREFIX = "ckp"
+COURSES_NAMESPACE = "courses"
+DOCUMENTS_NAMESPACE = "documents"
+
+def no_db_session_key_builder(
+    func: Callable[..., Any],
+    namespace: str = "",
+    *,
+    request: Optional[Request] = None,
+    response: Optional[Response] = None,
+    args: tuple = (),
+    kwargs: Optional[dict] = None,
+) -> str:
+    """Build a cache key from the call arguments, ignoring the injected DB session"""
+    kwargs = dict(kwargs or {})
+    # 每个请求的会话对象都不同，参与计算会导致缓存永不命中
+    kwargs.pop("db", None)
+    raw_key = f"{func.__module__}:{func.__name__}:{args}:{sorted(kwargs.items())}"
+    return f"{CACHE_PREFIX}:{namespace}:{hashlib.md5(raw_key.encode()).hexdigest()}"
+
+def init_cache():
+    """Initialize the cache backend, called once from the app lifespan"""
+    FastAPICache.init(
+        RedisBackend(aioredis.from_url(settings.REDIS_URL)),
+        prefix=CACHE_PREFIX,
+        key_builder=no_db_session_key_builder
+    )
+
+def clear_cache_namespace(namespace: str):
+    """Drop every cached entry in a namespace (for synchronous code such as Celery tasks)"""
+    keys = list(redis_client.scan_iter(match=f"{CACHE_PREFIX}:{namespace}:*"))
+    if keys:
+        redis_client.delete(*keys)
+
+async def clear_cache_namespace_async(namespace: str):
+    """Drop every cached entry in a namespace without blocking the event loop (for request handlers)"""
+    keys = [key async for key in async_redis_client.scan_iter(match=f"{CACHE_PREFIX}:{namespace}:*")]
+    if keys:
+        await async_redis_client.delete(*keys)
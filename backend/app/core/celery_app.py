@@ -0,0 +1,32 @@
+"""
+Celery application for long-running background jobs
+"""
+from celery import Celery
+
+from app.core.config import settings
+
+celery_app = Celery(
+    "ckp",
+    broker=settings.CELERY_BROKER_URL,
+    backend=settings.CELERY_RESULT_BACKEND,
+    include=["app.tasks.courses", "app.tasks.documents"],
+)
+
+celery_app.conf.update(
+    task_serializer="json",
+    accept_content=["json"],
+    result_serializer="json",
+    # 进度通过WebSocket推送，不需要保存任务返回值
+    task_ignore_result=True,
+    # LLM生成任务耗时长，路由到独立队列，由专门的worker消费
+    task_routes={
+        "courses.generate": {"queue": "llm"},
+        # 文档解析是CPU密集型任务，与LLM生成分开排队，可独立扩容
+        "documents.process": {"queue": "documents"},
+    },
+    # 并发数按队列在worker命令行上指定（见docker-compose.yml）：LLM队列限流，文档解析按CPU核数
+    worker_prefetch_multiplier=1,
+    # 任务完成后才确认，worker崩溃时任务重新入队而不是丢失
+    task_acks_late=True,
+    task_reject_on_worker_lost=True,
+)
@@ -1,7 +1,7 @@
 """
 Configuration settings for the application
 """
-from typing import List, Optional
+from typing import FrozenSet, List, Optional
 from pydantic_settings import BaseSettings
 from pydantic import Field, validator
 import os
@@ -27,11 +27,18 @@ class Settings(BaseSettings):
     # Database
     DATABASE_URL: str = Field(..., env="DATABASE_URL")
     REDIS_URL: str = Field(..., env="REDIS_URL")
+    # 连接池参数对同步与异步引擎分别生效，注意每个进程 × 2 个引擎不要超过 Postgres max_connections
+    DB_POOL_SIZE: int = Field(default=20, env="DB_POOL_SIZE")
+    DB_MAX_OVERFLOW: int = Field(default=10, env="DB_MAX_OVERFLOW")
+    DB_POOL_RECYCLE: int = Field(default=1800, env="DB_POOL_RECYCLE")
+    DB_POOL_TIMEOUT: int = Field(default=10, env="DB_POOL_TIMEOUT")
     
     # Neo4j
     NEO4J_URI: str = Field(..., env="NEO4J_URI")
     NEO4J_USER: str = Field(..., env="NEO4J_USER")
     NEO4J_PASSWORD: str = Field(..., env="NEO4J_PASSWORD")
+    NEO4J_MAX_POOL_SIZE: int = Field(default=50, env="NEO4J_MAX_POOL_SIZE")
+    NEO4J_ACQUISITION_TIMEOUT: int = Field(default=10, env="NEO4J_ACQUISITION_TIMEOUT")
     
     # Vector Database
     WEAVIATE_URL: str = Field(default="http://localhost:8080", env="WEAVIATE_URL")
@@ -50,7 +57,7 @@ class Settings(BaseSettings):
     
     # File Upload
     MAX_UPLOAD_SIZE: int = 10 * 1024 * 1024  # 10MB
-    ALLOWED_EXTENSIONS: List[str] = ["pdf", "docx", "doc", "xlsx", "xls", "txt", "md"]
+    ALLOWED_EXTENSIONS: FrozenSet[str] = frozenset({"pdf", "docx", "doc", "xlsx", "xls", "txt", "md"})
     UPLOAD_DIR: Path = Path("uploads")
     
     # CORS
@@ -59,11 +66,21 @@ class Settings(BaseSettings):
     # Celery
     CELERY_BROKER_URL: str = Field(default="redis://localhost:6379/1", env="CELERY_BROKER_URL")
     CELERY_RESULT_BACKEND: str = Field(default="redis://localhost:6379/2", env="CELERY_RESULT_BACKEND")
+    # 每个worker进程中同步LLM调用共用的线程数
+    COURSE_GEN_THREADS: int = Field(default=8, env="COURSE_GEN_THREADS")
+    
+    # Cache
+    # 统计接口的缓存秒数，设为 0 则每次直接查询数据库
+    STATS_CACHE_TTL: int = Field(default=60, env="STATS_CACHE_TTL")
     
     # Logging
     LOG_LEVEL: str = Field(default="INFO", env="LOG_LEVEL")
     LOG_FILE: str = Field(default="logs/app.log", env="LOG_FILE")
     
+    # Monitoring
+    # 开启后可在任意请求上加 ?profile=1 获取 pyinstrument 性能报告，勿在生产环境开启
+    PROFILING: bool = Field(default=False, env="PROFILING")
+    
     # Prompt Templates
     PROMPT_TEMPLATE_DIR: Path = Path("app/prompts")
     
@@ -73,6 +90,13 @@ class Settings(BaseSettings):
             v.mkdir(parents=True, exist_ok=True)
         return v
     
+    @validator("ALLOWED_EXTENSIONS", pre=True)
+    def parse_allowed_extensions(cls, v):
+        # 上传时按扩展名做成员判断，加载时统一转为小写集合
+        if isinstance(v, str):
+            v = v.split(",")
+        return frozenset(ext.strip().lower().lstrip(".") for ext in v)
+    
     @validator("CORS_ORIGINS", pre=True)
     def parse_cors_origins(cls, v):
         if isinstance(v, str):
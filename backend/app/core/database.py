@@ -1,13 +1,16 @@
 """
 Database configuration and connection management
 """
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker, Session
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession, async_sessionmaker
-from typing import Generator, AsyncGenerator
+from typing import Any, Generator, AsyncGenerator
+import asyncio
+from contextlib import AsyncExitStack, ExitStack
 import redis
-from neo4j import GraphDatabase
+from redis import asyncio as aioredis
+from neo4j import AsyncGraphDatabase
 import logging
 
 from app.core.config import settings
@@ -15,11 +18,15 @@ from app.core.config import settings
 logger = logging.getLogger(__name__)
 
 # PostgreSQL - Sync
+# LIFO 优先复用最近归还的连接：低负载时只有少数连接保持活跃，其余空闲连接可被服务端超时关闭（由 pre_ping 检测）
 engine = create_engine(
     settings.DATABASE_URL,
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_use_lifo=True
 )
 
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
@@ -28,10 +35,16 @@ SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 async_engine = create_async_engine(
     settings.DATABASE_URL.replace("postgresql://", "postgresql+asyncpg://"),
     pool_pre_ping=True,
-    pool_size=10,
-    max_overflow=20
+    pool_size=settings.DB_POOL_SIZE,
+    max_overflow=settings.DB_MAX_OVERFLOW,
+    pool_timeout=settings.DB_POOL_TIMEOUT,
+    pool_recycle=settings.DB_POOL_RECYCLE,
+    pool_use_lifo=True
 )
 
+# 启动时预先建立的连接数，避免首个请求承担建连延迟
+POOL_WARM_SIZE = 5
+
 AsyncSessionLocal = async_sessionmaker(
     async_engine,
     class_=AsyncSession,
@@ -41,8 +54,11 @@ Base = declarative_base()
 
 # Redis
 redis_client = redis.from_url(settings.REDIS_URL, decode_responses=True)
+# 异步客户端供API进程的异步处理函数使用，网络等待不阻塞事件循环
+async_redis_client = aioredis.from_url(settings.REDIS_URL, decode_responses=True)
 
 # Neo4j
+# 进程内共享一个异步driver，由其连接池复用连接；每个请求的session只是从池中借出一个连接
 class Neo4jConnection:
     def __init__(self):
         self.driver = None
@@ -50,18 +66,21 @@ class Neo4jConnection:
     def connect(self):
         """Create Neo4j connection"""
         try:
-            self.driver = GraphDatabase.driver(
+            self.driver = AsyncGraphDatabase.driver(
                 settings.NEO4J_URI,
-                auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD)
+                auth=(settings.NEO4J_USER, settings.NEO4J_PASSWORD),
+                max_connection_pool_size=settings.NEO4J_MAX_POOL_SIZE,
+                connection_acquisition_timeout=settings.NEO4J_ACQUISITION_TIMEOUT
             )
             logger.info("Connected to Neo4j")
         except Exception as e:
             logger.error(f"Failed to connect to Neo4j: {e}")
             
-    def close(self):
+    async def close(self):
         """Close Neo4j connection"""
         if self.driver:
-            self.driver.close()
+            await self.driver.close()
+            self.driver = None
             
     def get_session(self):
         """Get Neo4j session"""
@@ -93,13 +112,25 @@ def get_redis():
     """Get Redis client"""
     return redis_client
 
-def get_neo4j():
-    """Get Neo4j session"""
-    session = neo4j_conn.get_session()
-    try:
+async def get_neo4j() -> AsyncGenerator[Any, None]:
+    """Get async Neo4j session"""
+    async with neo4j_conn.get_session() as session:
         yield session
-    finally:
-        session.close()
+
+def _warm_sync_pool(size: int = POOL_WARM_SIZE):
+    """Open `size` connections on the sync engine and return them to the pool"""
+    with ExitStack() as stack:
+        for _ in range(size):
+            conn = stack.enter_context(engine.connect())
+            conn.execute(text("SELECT 1"))
+
+async def _warm_async_pool(size: int = POOL_WARM_SIZE):
+    """Open `size` connections on the async engine and return them to the pool"""
+    # 同时持有全部连接，确保池中真的建立了 size 个连接而不是复用同一个
+    async with AsyncExitStack() as stack:
+        for _ in range(size):
+            conn = await stack.enter_async_context(async_engine.connect())
+            await conn.execute(text("SELECT 1"))
 
 async def init_db():
     """Initialize database connections"""
@@ -108,6 +139,11 @@ async def init_db():
         Base.metadata.create_all(bind=engine)
         logger.info("Database tables created")
         
+        # Warm connection pools
+        _warm_sync_pool()
+        await asyncio.wait_for(_warm_async_pool(), timeout=10)
+        logger.info(f"Warmed {POOL_WARM_SIZE} connections per database pool")
+        
         # Test Redis connection
         redis_client.ping()
         logger.info("Connected to Redis")
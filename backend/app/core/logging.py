@@ -3,12 +3,50 @@ Logging configuration
 """
 import logging
 import logging.handlers
+import os
+import queue
+import stat
 import sys
 from pathlib import Path
+from typing import Optional
 from app.core.config import settings
 
+# 后台线程负责实际写控制台和文件，请求线程只把日志记录放入队列
+_listener: Optional[logging.handlers.QueueListener] = None
+
+class SizeTrackingRotatingFileHandler(logging.handlers.RotatingFileHandler):
+    """RotatingFileHandler that tracks the file size in memory instead of stat/seek/tell per record"""
+    
+    def _open(self):
+        stream = super()._open()
+        # 打开（含轮转后重新打开）时取一次真实大小，之后按写入的字节数累加
+        st = os.fstat(stream.fileno())
+        self._size = st.st_size if stat.S_ISREG(st.st_mode) else None
+        return stream
+    
+    def emit(self, record):
+        try:
+            # 只格式化一次：父类在 shouldRollover 和写入时各格式化一遍
+            msg = self.format(record) + self.terminator
+            if self.stream is None:
+                self.stream = self._open()
+            size = len(msg.encode(self.stream.encoding, errors="replace"))
+            if self.maxBytes > 0 and self._size is not None and self._size + size >= self.maxBytes:
+                self.doRollover()
+            self.stream.write(msg)
+            self.flush()
+            if self._size is not None:
+                self._size += size
+        except RecursionError:
+            raise
+        except Exception:
+            self.handleError(record)
+
 def setup_logging():
     """Setup logging configuration"""
+    global _listener
+    stop_logging()
+    
     # Create logs directory if it doesn't exist
     log_dir = Path("logs")
     log_dir.mkdir(exist_ok=True)
@@ -28,10 +66,9 @@ def setup_logging():
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     console_handler.setFormatter(console_format)
-    logger.addHandler(console_handler)
     
     # File handler
-    file_handler = logging.handlers.RotatingFileHandler(
+    file_handler = SizeTrackingRotatingFileHandler(
         settings.LOG_FILE,
         maxBytes=10*1024*1024,  # 10MB
         backupCount=5
@@ -42,8 +79,22 @@ def setup_logging():
         datefmt='%Y-%m-%d %H:%M:%S'
     )
     file_handler.setFormatter(file_format)
-    logger.addHandler(file_handler)
+    
+    # Queue handler on the root logger; the listener thread feeds the real handlers
+    log_queue = queue.SimpleQueue()
+    logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    _listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True
+    )
+    _listener.start()
     
     # Suppress noisy loggers
     logging.getLogger("uvicorn.access").setLevel(logging.WARNING)
-    logging.getLogger("httpx").setLevel(logging.WARNING)
\ No newline at end of file
+    logging.getLogger("httpx").setLevel(logging.WARNING)
+
+def stop_logging():
+    """Flush queued log records and stop the listener thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
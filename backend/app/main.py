@@ -1,15 +1,20 @@
 """
 Main FastAPI application
 """
-from fastapi import FastAPI
+from fastapi import FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
-from contextlib import asynccontextmanager
+from fastapi.responses import HTMLResponse, ORJSONResponse
+from prometheus_fastapi_instrumentator import Instrumentator
+from contextlib import asynccontextmanager, suppress
 import logging
+import asyncio
 
 from app.core.config import settings
 from app.api.v1.api import api_router
-from app.core.database import init_db
-from app.core.logging import setup_logging
+from app.core.database import async_redis_client, init_db, neo4j_conn
+from app.core.logging import setup_logging, stop_logging
+from app.core.cache import init_cache
+from app.api.v1.websocket import relay_task_updates
 
 # Setup logging
 setup_logging()
@@ -20,9 +25,21 @@ async def lifespan(app: FastAPI):
     # Startup
     logger.info(f"Starting {settings.APP_NAME} v{settings.APP_VERSION}")
     await init_db()
+    init_cache()
+    # 配置加载时已创建上传目录；启动时再确认一次，上传接口不再逐请求检查
+    settings.UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+    # 转发Celery worker发布的课程生成进度到WebSocket客户端
+    relay_task = asyncio.create_task(relay_task_updates())
     yield
     # Shutdown
     logger.info("Shutting down application")
+    relay_task.cancel()
+    # 等待订阅循环在finally中关闭pubsub连接后再关闭其他客户端
+    with suppress(asyncio.CancelledError):
+        await relay_task
+    await neo4j_conn.close()
+    await async_redis_client.aclose()
+    stop_logging()
 
 # Create FastAPI app
 app = FastAPI(
@@ -31,6 +48,7 @@ app = FastAPI(
     openapi_url=f"{settings.API_V1_STR}/openapi.json",
     docs_url="/docs",
     redoc_url="/redoc",
+    default_response_class=ORJSONResponse,
     lifespan=lifespan
 )
 
@@ -41,11 +59,31 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor"],
 )
 
 # Include API routers
 app.include_router(api_router, prefix=settings.API_V1_STR)
 
+# Prometheus metrics: per-route request count and latency histograms at /metrics
+Instrumentator(excluded_handlers=["/metrics", "/health"]).instrument(app).expose(
+    app, include_in_schema=False
+)
+
+if settings.PROFILING:
+    from pyinstrument import Profiler
+
+    @app.middleware("http")
+    async def profile_request(request: Request, call_next):
+        """Return a pyinstrument report instead of the response when ?profile=1"""
+        if request.query_params.get("profile") != "1":
+            return await call_next(request)
+        profiler = Profiler(async_mode="enabled")
+        profiler.start()
+        await call_next(request)
+        profiler.stop()
+        return HTMLResponse(profiler.output_html())
+
 # Root endpoint
 @app.get("/")
 async def root():
@@ -67,5 +105,7 @@ if __name__ == "__main__":
         "app.main:app",
         host=settings.HOST,
         port=settings.PORT,
-        reload=settings.DEBUG
+        reload=settings.DEBUG,
+        ws_ping_interval=20,
+        ws_ping_timeout=20
     )
\ No newline at end of file
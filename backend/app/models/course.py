@@ -2,7 +2,7 @@
 Course related models
 """
 from sqlalchemy import Column, String, Integer, ForeignKey, Text, Float, JSON
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import relationship, deferred
 from app.models.base import BaseModel
 
 class Course(BaseModel):
@@ -15,7 +15,7 @@ class Course(BaseModel):
     prerequisites = Column(Text)
     difficulty_level = Column(String(50))  # beginner, intermediate, advanced
     estimated_hours = Column(Float)
-    status = Column(String(50), default="draft")  # draft, published, archived
+    status = Column(String(50), default="draft", index=True)  # draft, published, archived
     
     # Learning outcomes and objectives stored as JSON
     learning_outcomes = Column(JSON)
@@ -27,7 +27,7 @@ class Course(BaseModel):
     
     # Relationships
     creator = relationship("User", back_populates="courses")
-    chapters = relationship("Chapter", back_populates="course", cascade="all, delete-orphan")
+    chapters = relationship("Chapter", back_populates="course", cascade="all, delete-orphan", order_by="Chapter.chapter_number")
     
 class Chapter(BaseModel):
     __tablename__ = "chapters"
@@ -40,11 +40,11 @@ class Chapter(BaseModel):
     learning_objectives = Column(JSON)
     
     # Foreign keys
-    course_id = Column(Integer, ForeignKey("courses.id"), nullable=False)
+    course_id = Column(Integer, ForeignKey("courses.id"), nullable=False, index=True)
     
     # Relationships
     course = relationship("Course", back_populates="chapters")
-    sections = relationship("Section", back_populates="chapter", cascade="all, delete-orphan")
+    sections = relationship("Section", back_populates="chapter", cascade="all, delete-orphan", order_by="Section.section_number")
     
 class Section(BaseModel):
     __tablename__ = "sections"
@@ -52,15 +52,15 @@ class Section(BaseModel):
     section_number = Column(String(20))  # e.g., "1.1", "1.2"
     title = Column(String(255), nullable=False)
     description = Column(Text)
-    content = Column(Text)
+    content = deferred(Column(Text))  # LLM生成的正文，体积大；需要时用 undefer(Section.content) 加载
     estimated_minutes = Column(Integer)
     
     # Foreign keys
-    chapter_id = Column(Integer, ForeignKey("chapters.id"), nullable=False)
+    chapter_id = Column(Integer, ForeignKey("chapters.id"), nullable=False, index=True)
     
     # Relationships
     chapter = relationship("Chapter", back_populates="sections")
-    knowledge_points = relationship("KnowledgePoint", back_populates="section", cascade="all, delete-orphan")
+    knowledge_points = relationship("KnowledgePoint", back_populates="section", cascade="all, delete-orphan", order_by="KnowledgePoint.point_id")
     
 class KnowledgePoint(BaseModel):
     __tablename__ = "knowledge_points"
@@ -72,7 +72,7 @@ class KnowledgePoint(BaseModel):
     prerequisites = Column(JSON)  # Array of prerequisite point IDs
     
     # Foreign keys
-    section_id = Column(Integer, ForeignKey("sections.id"), nullable=False)
+    section_id = Column(Integer, ForeignKey("sections.id"), nullable=False, index=True)
     
     # Relationships
     section = relationship("Section", back_populates="knowledge_points")
\ No newline at end of file
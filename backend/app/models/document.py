@@ -1,16 +1,30 @@
 """
 Document model
 """
-from sqlalchemy import Column, String, Integer, ForeignKey, Text, Float, DateTime, Boolean
+from sqlalchemy import Column, String, Integer, ForeignKey, Text, Float, DateTime, Boolean, JSON, Index, text
 from sqlalchemy.orm import relationship
-from sqlalchemy.sql import func
+from datetime import datetime, timedelta, timezone
 from app.models.base import BaseModel
 
 class Document(BaseModel):
     __tablename__ = "documents"
+    __table_args__ = (
+        # 部分索引只覆盖未删除的文档，服务超时清理与处理状态统计
+        Index(
+            "ix_documents_active_status",
+            "status", "processing_started_at",
+            postgresql_where=text("is_deleted = false")
+        ),
+        # 失败文档列表按 updated_at 倒序分页，B-tree 可反向扫描
+        Index(
+            "ix_documents_failed_updated",
+            "updated_at",
+            postgresql_where=text("status = 'failed' AND is_deleted = false")
+        ),
+    )
     
     filename = Column(String(255), nullable=False)
-    file_type = Column(String(50))  # pdf, docx, xlsx, txt, md
+    file_type = Column(String(50), index=True)  # pdf, docx, xlsx, txt, md
     file_path = Column(String(500))
     file_size = Column(Integer)  # in bytes
     content_hash = Column(String(64))  # SHA256 hash
@@ -18,10 +32,10 @@ class Document(BaseModel):
     # Extracted content
     raw_content = Column(Text)
     processed_content = Column(Text)
-    doc_metadata = Column("metadata", Text)  # JSON string
+    doc_metadata = Column("metadata", JSON)
     
     # Processing status and timing
-    status = Column(String(50), default="uploaded")  # uploaded, processing, processed, failed
+    status = Column(String(50), default="uploaded", index=True)  # uploaded, processing, processed, failed
     error_message = Column(Text)
     processing_started_at = Column(DateTime(timezone=True))
     processing_completed_at = Column(DateTime(timezone=True))
@@ -47,5 +61,5 @@ class Document(BaseModel):
         if self.status != "processing" or not self.processing_started_at:
             return False
         
-        timeout_threshold = func.now() - func.make_interval(mins=timeout_minutes)
+        timeout_threshold = datetime.now(timezone.utc) - timedelta(minutes=timeout_minutes)
         return self.processing_started_at < timeout_threshold
\ No newline at end of file
@@ -0,0 +1,53 @@
+from pydantic import BaseModel, field_validator
+from typing import List, Optional
+
+class CourseConfig(BaseModel):
+    # 前端不同版本使用过的课程名称字段
+    name: Optional[str] = None
+    title: Optional[str] = None
+    courseName: Optional[str] = None
+    level: str = "intermediate"
+    audience: str = ""
+    duration: float = 16.0
+    mode: Optional[str] = None
+    type: str = "通用"
+    chapters: int = 8
+    
+    @field_validator("duration", mode="before")
+    @classmethod
+    def strip_duration_unit(cls, v):
+        # 前端可能传 "16课时"
+        if isinstance(v, str):
+            return v.replace("课时", "").strip()
+        return v
+
+class CourseGenerateRequest(BaseModel):
+    document_ids: List[int] = []
+    course_config: CourseConfig = CourseConfig()
+
+# 以下更新模型的字段均为可选，路由只写入请求中出现的字段 (model_dump(exclude_unset=True))
+class CourseUpdate(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    difficulty_level: Optional[str] = None
+    target_audience: Optional[str] = None
+    estimated_hours: Optional[float] = None
+    status: Optional[str] = None
+
+class ChapterUpdate(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    estimated_hours: Optional[float] = None
+    difficulty_level: Optional[str] = None
+    learning_objectives: Optional[list] = None
+
+class SectionUpdate(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    content: Optional[str] = None
+    estimated_minutes: Optional[int] = None
+
+class KnowledgePointUpdate(BaseModel):
+    title: Optional[str] = None
+    description: Optional[str] = None
+    point_type: Optional[str] = None
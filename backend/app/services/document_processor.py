@@ -2,66 +2,77 @@
 Document processing service for multiple file formats
 """
 import os
+import re
 import hashlib
+import zipfile
 from pathlib import Path
-from typing import Dict, Any, Optional
+from typing import Dict, Any, List, Optional
 import logging
 
 import PyPDF2
-from docx import Document as DocxDocument
+from lxml import etree
 import pandas as pd
-import markdown
-from langchain.document_loaders import PyPDFLoader, UnstructuredWordDocumentLoader
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 
 logger = logging.getLogger(__name__)
 
+# WordprocessingML 命名空间，用于直接解析 .docx 内的 XML
+_W = "{http://schemas.openxmlformats.org/wordprocessingml/2006/main}"
+# 上传的 .docx 不可信：不展开实体、不访问网络、不放开超大文档限制（与 python-docx 的 oxml_parser 一致）
+_DOCX_XML_PARSER = etree.XMLParser(resolve_entities=False, no_network=True, huge_tree=False)
+
+# 分块时优先在段落、换行、空格处断开；都没有时（如中文长段落）按字符数硬切
+_CHUNK_SEPARATORS = ("\n\n", "\n", " ")
+_WHITESPACE_RE = re.compile(r"\s")
+
+# 文本类文件只读一次：同一份字节既用于哈希和大小，也解码后交给解析器
+_TEXT_FILE_TYPES = frozenset({'txt', 'md'})
+
+# Markdown ATX 标题行
+_MARKDOWN_HEADER_RE = re.compile(r'^#{1,6}[ \t]+(.+)$', re.MULTILINE)
+
 class DocumentProcessor:
     """Process various document formats"""
     
-    def __init__(self):
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=1000,
-            chunk_overlap=200,
-            length_function=len,
-            separators=["\n\n", "\n", " ", ""]
-        )
+    __slots__ = ('chunk_size', 'chunk_overlap')
+    
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200):
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
         
-    def process_document(self, file_path: str, file_type: str) -> Dict[str, Any]:
+    def process_document(self, file_path: str, file_type: str, file_hash: Optional[str] = None) -> Dict[str, Any]:
         """
         Process a document based on its type
         
         Args:
             file_path: Path to the document
             file_type: Type of document (pdf, docx, xlsx, txt, md)
+            file_hash: SHA256 of the file if already known (skips re-reading it)
             
         Returns:
             Dictionary containing processed content and metadata
         """
         try:
-            processors = {
-                'pdf': self._process_pdf,
-                'docx': self._process_docx,
-                'doc': self._process_docx,
-                'xlsx': self._process_excel,
-                'xls': self._process_excel,
-                'txt': self._process_text,
-                'md': self._process_markdown
-            }
-            
-            processor = processors.get(file_type.lower())
+            file_type = file_type.lower()
+            processor = self._PROCESSORS.get(file_type)
             if not processor:
                 raise ValueError(f"Unsupported file type: {file_type}")
-                
-            result = processor(file_path)
+            
+            if file_type in _TEXT_FILE_TYPES:
+                data = Path(file_path).read_bytes()
+                result = processor(self, self._decode_text(data))
+                file_size = len(data)
+                file_hash = file_hash or hashlib.sha256(data).hexdigest()
+            else:
+                result = processor(self, file_path)
+                file_size = os.path.getsize(file_path)
             
             # Add common metadata
-            result['file_hash'] = self._calculate_file_hash(file_path)
-            result['file_size'] = os.path.getsize(file_path)
+            result['file_hash'] = file_hash or self._calculate_file_hash(file_path)
+            result['file_size'] = file_size
             
             # Split content into chunks
             if result.get('content'):
-                result['chunks'] = self.text_splitter.split_text(result['content'])
+                result['chunks'] = self._split_text(result['content'])
                 result['chunk_count'] = len(result['chunks'])
                 
             return result
@@ -74,28 +85,57 @@ class DocumentProcessor:
                 'content': None
             }
     
+    def _split_text(self, text: str) -> List[str]:
+        """Split text into overlapping chunks of at most chunk_size characters"""
+        # 在原字符串上用 rfind/正则按下标定位断点，每块只切片一次，不做递归拆分与合并
+        chunks = []
+        start = 0
+        end = 0
+        length = len(text)
+        while start < length:
+            # 断点必须落在上一块末尾之后，保证每块都向前推进
+            previous_end = end
+            end = min(start + self.chunk_size, length)
+            if end < length:
+                for separator in _CHUNK_SEPARATORS:
+                    cut = text.rfind(separator, max(start, previous_end) + 1, end)
+                    if cut != -1:
+                        end = cut
+                        break
+            
+            chunk = text[start:end].strip()
+            if chunk:
+                chunks.append(chunk)
+            if end >= length:
+                break
+            
+            # 下一块从本块末尾回退 chunk_overlap 个字符开始，尽量对齐到空白处
+            next_start = max(end - self.chunk_overlap, start + 1)
+            whitespace = _WHITESPACE_RE.search(text, next_start, end)
+            start = whitespace.end() if whitespace else next_start
+        return chunks
+    
     def _process_pdf(self, file_path: str) -> Dict[str, Any]:
         """Process PDF document"""
         try:
-            loader = PyPDFLoader(file_path)
-            documents = loader.load()
-            
-            # Extract text content
-            content = "\n\n".join([doc.page_content for doc in documents])
-            
-            # Extract metadata
+            # 只解析一次PDF：同一个 PdfReader 既提取每页文本也读取元数据
             with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
+                pdf_reader = PyPDF2.PdfReader(file, strict=False)
+                
+                # Extract text content
+                content = "\n\n".join(page.extract_text() or "" for page in pdf_reader.pages)
+                
+                # Extract metadata
                 metadata = {
                     'page_count': len(pdf_reader.pages),
-                    'pdf_info': pdf_reader.metadata if pdf_reader.metadata else {}
+                    # PDF 信息字典的值是 PyPDF2 对象，转成字符串以便存入 JSON 列
+                    'pdf_info': {key: str(value) for key, value in (pdf_reader.metadata or {}).items()}
                 }
                 
             return {
                 'success': True,
                 'content': content,
-                'metadata': metadata,
-                'documents': documents
+                'metadata': metadata
             }
             
         except Exception as e:
@@ -105,44 +145,57 @@ class DocumentProcessor:
     def _process_docx(self, file_path: str) -> Dict[str, Any]:
         """Process Word document"""
         try:
-            doc = DocxDocument(file_path)
+            # 直接解析 word/document.xml，单次遍历正文的段落和表格，
+            # 不为每个段落创建 python-docx 包装对象，也不逐段解析样式对象
+            with zipfile.ZipFile(file_path) as docx_zip:
+                body = etree.fromstring(docx_zip.read("word/document.xml"), _DOCX_XML_PARSER).find(f"{_W}body")
+                style_names = self._docx_style_names(docx_zip)
             
             # Extract text with structure
             content_parts = []
             structure_info = []
+            tables_data = []
+            paragraph_count = 0
             
-            for paragraph in doc.paragraphs:
-                if paragraph.text.strip():
-                    content_parts.append(paragraph.text)
+            for element in body:
+                if element.tag == f"{_W}p":
+                    paragraph_count += 1
+                    text = self._docx_paragraph_text(element)
+                    if not text.strip():
+                        continue
+                    content_parts.append(text)
                     
                     # Identify structure (headings)
-                    if paragraph.style.name.startswith('Heading'):
-                        level = paragraph.style.name.split(' ')[-1] if ' ' in paragraph.style.name else '1'
+                    style = element.find(f"{_W}pPr/{_W}pStyle")
+                    style_name = style_names.get(style.get(f"{_W}val"), "") if style is not None else ""
+                    if style_name.lower().startswith('heading'):
+                        level = style_name.split(' ')[-1] if ' ' in style_name else '1'
                         structure_info.append({
                             'type': 'heading',
                             'level': level,
-                            'text': paragraph.text
+                            'text': text
                         })
                     else:
                         structure_info.append({
                             'type': 'paragraph',
-                            'text': paragraph.text[:100]  # First 100 chars
+                            'text': text[:100]  # First 100 chars
                         })
-            
-            # Extract tables
-            tables_data = []
-            for table in doc.tables:
-                table_content = []
-                for row in table.rows:
-                    row_data = [cell.text for cell in row.cells]
-                    table_content.append(row_data)
-                tables_data.append(table_content)
+                
+                elif element.tag == f"{_W}tbl":
+                    # Extract tables
+                    tables_data.append([
+                        [
+                            "\n".join(self._docx_paragraph_text(p) for p in cell.iterchildren(f"{_W}p"))
+                            for cell in row.iterchildren(f"{_W}tc")
+                        ]
+                        for row in element.iterchildren(f"{_W}tr")
+                    ])
             
             content = "\n\n".join(content_parts)
             
             metadata = {
-                'paragraph_count': len(doc.paragraphs),
-                'table_count': len(doc.tables),
+                'paragraph_count': paragraph_count,
+                'table_count': len(tables_data),
                 'structure': structure_info[:10],  # First 10 structure elements
                 'tables_summary': f"{len(tables_data)} tables found"
             }
@@ -159,16 +212,46 @@ class DocumentProcessor:
             logger.error(f"Word document processing error: {str(e)}")
             raise
     
+    def _docx_style_names(self, docx_zip: zipfile.ZipFile) -> Dict[str, str]:
+        """Map paragraph style IDs to style names from word/styles.xml"""
+        try:
+            styles = etree.fromstring(docx_zip.read("word/styles.xml"), _DOCX_XML_PARSER)
+        except KeyError:
+            return {}
+        names = {}
+        for style in styles.iterchildren(f"{_W}style"):
+            name = style.find(f"{_W}name")
+            if name is not None:
+                names[style.get(f"{_W}styleId")] = name.get(f"{_W}val", "")
+        return names
+    
+    def _docx_paragraph_text(self, paragraph) -> str:
+        """Text of a <w:p> element, built from its runs the way python-docx does"""
+        parts = []
+        for run in paragraph.iterchildren(f"{_W}r", f"{_W}hyperlink"):
+            runs = run.iterchildren(f"{_W}r") if run.tag == f"{_W}hyperlink" else (run,)
+            for r in runs:
+                for child in r:
+                    tag = child.tag
+                    if tag == f"{_W}t":
+                        parts.append(child.text or "")
+                    elif tag in (f"{_W}tab", f"{_W}ptab"):
+                        parts.append("\t")
+                    elif tag in (f"{_W}br", f"{_W}cr"):
+                        if child.get(f"{_W}type", "textWrapping") == "textWrapping":
+                            parts.append("\n")
+                    elif tag == f"{_W}noBreakHyphen":
+                        parts.append("-")
+        return "".join(parts)
+    
     def _process_excel(self, file_path: str) -> Dict[str, Any]:
         """Process Excel file"""
         try:
-            excel_file = pd.ExcelFile(file_path)
+            # 一次解析整个工作簿，得到 {工作表名: DataFrame}，之后不再重复读取文件
+            sheets = pd.read_excel(file_path, sheet_name=None)
             sheets_content = []
-            sheets_data = {}
             
-            for sheet_name in excel_file.sheet_names:
-                df = pd.read_excel(file_path, sheet_name=sheet_name)
-                
+            for sheet_name, df in sheets.items():
                 # Convert to descriptive text
                 sheet_text = f"Worksheet: {sheet_name}\n"
                 sheet_text += f"Rows: {len(df)}, Columns: {len(df.columns)}\n"
@@ -179,33 +262,36 @@ class DocumentProcessor:
                     sheet_text += df.head(5).to_string(index=False)
                     
                 sheets_content.append(sheet_text)
-                sheets_data[sheet_name] = df.to_dict('records')
             
             content = "\n\n".join(sheets_content)
             
             metadata = {
-                'sheet_count': len(excel_file.sheet_names),
-                'sheets': excel_file.sheet_names,
-                'total_rows': sum(len(pd.read_excel(file_path, sheet)) for sheet in excel_file.sheet_names)
+                'sheet_count': len(sheets),
+                'sheets': list(sheets),
+                'total_rows': sum(len(df) for df in sheets.values())
             }
             
             return {
                 'success': True,
                 'content': content,
                 'metadata': metadata,
-                'sheets_data': sheets_data
+                'sheets_data': {sheet_name: df.to_dict('records') for sheet_name, df in sheets.items()}
             }
             
         except Exception as e:
             logger.error(f"Excel processing error: {str(e)}")
             raise
     
-    def _process_text(self, file_path: str) -> Dict[str, Any]:
-        """Process plain text file"""
+    def _decode_text(self, data: bytes) -> str:
+        """Decode UTF-8 file bytes with universal newlines, as open(..., 'r') would"""
+        content = data.decode('utf-8')
+        if '\r' in content:
+            content = content.replace('\r\n', '\n').replace('\r', '\n')
+        return content
+    
+    def _process_text(self, content: str) -> Dict[str, Any]:
+        """Process plain text file content"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                content = file.read()
-                
             lines = content.split('\n')
             
             metadata = {
@@ -224,18 +310,11 @@ class DocumentProcessor:
             logger.error(f"Text file processing error: {str(e)}")
             raise
     
-    def _process_markdown(self, file_path: str) -> Dict[str, Any]:
-        """Process Markdown file"""
+    def _process_markdown(self, md_content: str) -> Dict[str, Any]:
+        """Process Markdown file content"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                md_content = file.read()
-                
-            # Convert to HTML for structure analysis
-            html_content = markdown.markdown(md_content, extensions=['extra', 'toc'])
-            
             # Extract headers
-            import re
-            headers = re.findall(r'^#{1,6}\s+(.+)$', md_content, re.MULTILINE)
+            headers = _MARKDOWN_HEADER_RE.findall(md_content)
             
             metadata = {
                 'header_count': len(headers),
@@ -247,7 +326,6 @@ class DocumentProcessor:
             return {
                 'success': True,
                 'content': md_content,
-                'html_content': html_content,
                 'metadata': metadata
             }
             
@@ -257,8 +335,17 @@ class DocumentProcessor:
     
     def _calculate_file_hash(self, file_path: str) -> str:
         """Calculate SHA256 hash of file"""
-        sha256_hash = hashlib.sha256()
+        # file_digest 以大块 readinto 读入复用的缓冲区，由 OpenSSL 实现计算，避免逐 4KB 的 Python 循环
         with open(file_path, "rb") as f:
-            for byte_block in iter(lambda: f.read(4096), b""):
-                sha256_hash.update(byte_block)
-        return sha256_hash.hexdigest()
\ No newline at end of file
+            return hashlib.file_digest(f, "sha256").hexdigest()
+    
+    # 文件类型到解析方法的分派表，类定义时构建一次，不在每次处理时重建
+    _PROCESSORS = {
+        'pdf': _process_pdf,
+        'docx': _process_docx,
+        'doc': _process_docx,
+        'xlsx': _process_excel,
+        'xls': _process_excel,
+        'txt': _process_text,
+        'md': _process_markdown
+    }
\ No newline at end of file
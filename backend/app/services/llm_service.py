@@ -5,6 +5,7 @@ import json
 import logging
 import time
 import asyncio
+from functools import lru_cache
 from typing import Dict, Any, List, Optional
 from langchain.llms import OpenAI
 from langchain.chat_models import ChatOpenAI
@@ -17,6 +18,9 @@ from app.core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# 知识图谱提示词中课程内容JSON的最大字符数，超出部分被截断
+KNOWLEDGE_GRAPH_CONTENT_CHARS = 4000
+
 # Custom exceptions
 class LLMEmptyResponseError(Exception):
     """Raised when LLM returns empty or invalid response"""
@@ -439,7 +443,7 @@ SMART原则要求：
 基于以下课程内容，生成增强的知识图谱。
 
 课程内容：
-{json.dumps(course_content, ensure_ascii=False, indent=2)[:4000]}
+{json.dumps(course_content, ensure_ascii=False, indent=2)[:KNOWLEDGE_GRAPH_CONTENT_CHARS]}
 
 请分析并构建知识图谱：
 
@@ -757,4 +761,9 @@ SMART原则要求：
             
         except Exception as e:
             logger.error(f"Error optimizing content: {str(e)}")
-            return content
\ No newline at end of file
+            return content
+
+@lru_cache(maxsize=1)
+def get_llm_service() -> LLMService:
+    """Return the process-wide LLMService, created on first use"""
+    return LLMService()
@@ -0,0 +1,396 @@
+"""
+Celery tasks for course content generation
+"""
+import asyncio
+import atexit
+import concurrent.futures
+import logging
+from typing import TYPE_CHECKING, List
+
+from cachetools import LRUCache
+from celery.signals import celeryd_after_setup, worker_process_init
+
+from app.core.cache import COURSES_NAMESPACE, clear_cache_namespace
+from app.core.celery_app import celery_app
+from app.core.config import settings
+from app.core.database import SessionLocal
+from app.models.course import Course, Chapter, Section, KnowledgePoint
+from app.models.document import Document
+from app.api.v1.websocket import send_progress_update, send_completion_update, send_error_update
+
+if TYPE_CHECKING:
+    from app.services.llm_service import LLMService
+
+logger = logging.getLogger(__name__)
+
+# 同步LLM调用共用的线程池；线程在首次提交时才创建，fork出的worker进程各自拥有
+# 池大小同时限制了单个任务内并发生成的章节数
+_llm_executor = concurrent.futures.ThreadPoolExecutor(
+    max_workers=settings.COURSE_GEN_THREADS, thread_name_prefix="course-gen"
+)
+atexit.register(_llm_executor.shutdown)
+
+# 拼接后的文档内容，以 ((id, updated_at), ...) 为键；文档重新处理后 updated_at 变化，旧条目自然失效
+_document_content_cache: LRUCache = LRUCache(maxsize=16)
+
+# 本worker是否消费LLM队列；在主进程中确定，fork出的子进程继承
+_consumes_llm_queue = False
+
+@celeryd_after_setup.connect
+def _detect_llm_queue(sender, instance, **_):
+    global _consumes_llm_queue
+    _consumes_llm_queue = "llm" in instance.app.amqp.queues.consume_from
+
+# 每个worker进程只创建一次LLM客户端，所有任务复用
+# LLM依赖（langchain等）只在消费LLM队列的worker中导入；文档解析worker和API进程导入本模块仅用于投递任务
+@worker_process_init.connect
+def _init_llm_service(**_):
+    if _consumes_llm_queue:
+        _get_llm_service()
+
+def _get_llm_service() -> "LLMService":
+    """Return the process-wide LLMService (created lazily outside prefork workers)"""
+    from app.services.llm_service import get_llm_service
+    return get_llm_service()
+
+def _load_document_content(db, document_ids: List[int]) -> str:
+    """Concatenate the documents' text, reusing the result while none of them changed"""
+    versions = tuple(
+        (doc_id, updated_at)
+        for doc_id, updated_at in db.query(Document.id, Document.updated_at)
+        .filter(Document.id.in_(document_ids))
+        .order_by(Document.id)
+    )
+    content = _document_content_cache.get(versions)
+    if content is None:
+        rows = db.query(Document.processed_content, Document.raw_content).filter(
+            Document.id.in_(document_ids)
+        ).order_by(Document.id).all()
+        content = "\n\n".join([
+            processed or raw
+            for processed, raw in rows if processed or raw
+        ])
+        _document_content_cache[versions] = content
+    return content
+
+@celery_app.task(name="courses.generate")
+def generate_course_task(course_id: int, document_ids: List[int], config: dict):
+    """Generate detailed course content in a Celery worker"""
+    run_course_generation_sync(course_id, document_ids, config)
+
+def run_course_generation_sync(course_id: int, document_ids: List[int], config: dict):
+    """同步执行课程生成任务，在Celery worker进程中运行"""
+    # 每个任务在独立的事件循环中运行；阻塞的LLM调用交给共享线程池
+    asyncio.run(generate_course_content_task_impl(course_id, document_ids, config))
+
+async def generate_course_content_task_impl(course_id: int, document_ids: List[int], config: dict):
+    """Background task to generate detailed course content using LLM"""
+    loop = asyncio.get_running_loop()
+    # 提交后不使对象过期：读取已加载的属性不会在漫长的LLM调用期间悄悄开启新事务
+    db = SessionLocal(expire_on_commit=False)
+    task_id = f"task-{course_id}"
+    course = None
+    structure_future = None
+    
+    try:
+        # 发送开始通知
+        await send_progress_update(task_id, "initializing", 5, "开始课程生成...")
+        
+        # Get course
+        course = db.get(Course, course_id)
+        if not course:
+            error_msg = f"Course {course_id} not found"
+            logger.error(error_msg)
+            await send_error_update(task_id, error_msg, "initializing")
+            return
+        
+        llm_service = _get_llm_service()
+        
+        await send_progress_update(task_id, "preparing", 10, "准备文档内容...")
+        
+        # Get documents content
+        document_content = ""
+        if document_ids:
+            document_content = _load_document_content(db, document_ids)
+        
+        # If no document content, use course title and description
+        if not document_content:
+            document_content = f"课程标题：{course.title}\n课程描述：{course.description}"
+        
+        # 结束读取事务，等待LLM期间不占用连接
+        db.commit()
+        
+        logger.info(f"Starting LLM-based content generation for course {course_id}")
+        
+        await send_progress_update(task_id, "introduction", 20, "生成课程介绍...")
+        
+        # 章节结构只依赖文档内容，与课程介绍同时提交；学习目标需要介绍给出的难度，随后单独生成
+        structure_future = loop.run_in_executor(
+            _llm_executor,
+            llm_service.generate_chapter_structure,
+            document_content,
+            config.get('chapters', 8)
+        )
+        
+        # 1. Generate course introduction (异步执行)
+        intro_result = await loop.run_in_executor(
+            _llm_executor,
+            llm_service.generate_course_introduction,
+            document_content,
+            config.get('type', '通用')
+        )
+        
+        if intro_result['success']:
+            intro_data = intro_result['data']
+            # 更新课程标题和描述
+            if intro_data.get('title'):
+                course.title = intro_data.get('title')
+            course.description = intro_data.get('brief_description') or course.description
+            course.brief_description = intro_data.get('brief_description')
+            course.target_audience = intro_data.get('target_audience')
+            course.prerequisites = intro_data.get('prerequisites')
+            course.learning_outcomes = intro_data.get('learning_outcomes', [])
+            course.course_highlights = intro_data.get('course_highlights', [])
+            course.difficulty_level = intro_data.get('difficulty_level', 'intermediate')
+            # 立即提交课程基本信息更新
+            db.commit()
+            logger.info("Course introduction generated successfully")
+            await send_progress_update(task_id, "introduction", 30, "课程介绍生成完成")
+        else:
+            error_msg = f"Failed to generate course introduction: {intro_result.get('error')}"
+            logger.error(error_msg)
+            await send_error_update(task_id, error_msg, "introduction")
+        
+        await send_progress_update(task_id, "objectives", 40, "生成学习目标...")
+        
+        # 2. Generate learning objectives (异步执行)
+        objectives_result = await loop.run_in_executor(
+            _llm_executor,
+            llm_service.generate_learning_objectives,
+            document_content,
+            course.difficulty_level
+        )
+        
+        if objectives_result['success']:
+            objectives_data = objectives_result['data']
+            course.objectives = objectives_data
+            db.commit()
+            logger.info("Learning objectives generated successfully")
+            await send_progress_update(task_id, "objectives", 50, "学习目标生成完成")
+        else:
+            error_msg = f"Failed to generate learning objectives: {objectives_result.get('error')}"
+            logger.error(error_msg)
+            await send_error_update(task_id, error_msg, "objectives")
+        
+        await send_progress_update(task_id, "structure", 60, "生成章节结构...")
+        
+        # 3. Generate chapter structure (framework only) (已与课程介绍并发执行)
+        structure_result = await structure_future
+        
+        # 任务延迟确认（acks_late），worker崩溃或超过可见性超时后会被重新投递：
+        # 先删除上一次执行留下的章节树（级联删除小节和知识点），重复执行不会产生重复章节
+        course.chapters.clear()
+        
+        chapters_list = []
+        if structure_result['success']:
+            structure_data = structure_result['data']
+            chapters_data = structure_data.get('chapters', [])
+            
+            # Create chapter records (without detailed content)
+            for i, chapter_info in enumerate(chapters_data):
+                chapter = Chapter(
+                    course_id=course_id,
+                    chapter_number=chapter_info.get('chapter_id', i + 1),
+                    title=chapter_info.get('chapter_title', f'第{i+1}章'),
+                    description=chapter_info.get('chapter_description', ''),
+                    estimated_hours=chapter_info.get('estimated_hours', 2.0),
+                    learning_objectives=chapter_info.get('learning_objectives', [])
+                )
+                chapters_list.append((chapter, chapter_info))
+            
+            # 章节在下方统一提交时批量插入
+            db.add_all([chapter for chapter, _ in chapters_list])
+            
+            # Update total estimated hours
+            course.estimated_hours = structure_data.get('estimated_hours', course.estimated_hours)
+            logger.info(f"Generated {len(chapters_data)} chapter frameworks")
+            await send_progress_update(task_id, "structure", 70, f"生成了 {len(chapters_data)} 个章节框架")
+            
+        else:
+            error_msg = f"Failed to generate chapter structure: {structure_result.get('error')}"
+            logger.error(error_msg)
+            await send_error_update(task_id, error_msg, "structure")
+            # Fallback: create a basic chapter structure
+            chapter = Chapter(
+                course_id=course_id,
+                chapter_number=1,
+                title="第一章：课程概述",
+                description="本章介绍课程的基本概念和核心内容",
+                estimated_hours=2.0
+            )
+            db.add(chapter)
+            chapters_list.append((chapter, {}))
+            await send_progress_update(task_id, "structure", 70, "使用默认章节结构")
+        
+        # Commit chapters first
+        db.commit()
+        
+        await send_progress_update(task_id, "content", 75, "开始生成章节详细内容...")
+        
+        # 4. Generate detailed content for each chapter separately
+        logger.info("Starting detailed content generation for each chapter...")
+        
+        total_chapters = len(chapters_list)
+        # 各章节相互独立，同时提交给线程池并发生成
+        content_futures = [
+            loop.run_in_executor(
+                _llm_executor,
+                llm_service.generate_simple_chapter_content,
+                document_content,
+                chapter_info,
+                chapter.chapter_number
+            )
+            for chapter, chapter_info in chapters_list
+        ]
+        
+        # 按完成顺序上报进度，异常留到下方逐章处理
+        for completed, next_done in enumerate(asyncio.as_completed(content_futures), 1):
+            try:
+                await next_done
+            except Exception:
+                pass
+            progress = 75 + (completed / total_chapters) * 20  # 75-95%的进度
+            await send_progress_update(task_id, "content", int(progress),
+                                     f"已生成 {completed}/{total_chapters} 个章节内容")
+        
+        # 按章节顺序写入结果
+        for (chapter, chapter_info), content_future in zip(chapters_list, content_futures):
+            try:
+                content_result = content_future.result()
+                
+                if content_result['success']:
+                    content_data = content_result['data']
+                    sections_data = content_data.get('sections', [])
+                    
+                    # Create sections and knowledge points
+                    # 知识点挂在小节的关系上，提交时按表批量插入，无需逐行 flush 取ID
+                    for i, section_info in enumerate(sections_data, 1):
+                        # 使用LLM生成的概要内容，而不是重新构建
+                        section_content = section_info.get('content', f"## {section_info.get('title', '')}\n\n暂无内容概要")
+                        knowledge_points_data = section_info.get('knowledge_points', [])
+                        
+                        section = Section(
+                            chapter_id=chapter.id,
+                            section_number=f"{chapter.chapter_number}.{i}",
+                            title=section_info.get('title', ''),
+                            description=f"第{chapter.chapter_number}.{i}节 - {section_info.get('title', '')}",
+                            content=section_content,  # 保存详细的内容
+                            estimated_minutes=45
+                        )
+                        
+                        # Create knowledge points
+                        section.knowledge_points = [
+                            KnowledgePoint(
+                                point_id=f"{chapter.chapter_number}.{i}.{j}",
+                                title=kp_info.get('title', ''),
+                                description=kp_info.get('description', ''),
+                                point_type='concept',  # 简化类型
+                                prerequisites=[]  # 简化依赖
+                            )
+                            for j, kp_info in enumerate(knowledge_points_data, 1)
+                        ]
+                        db.add(section)
+                    
+                    logger.info(f"Generated {len(sections_data)} sections for Chapter {chapter.chapter_number}")
+                    
+                else:
+                    logger.error(f"Failed to generate content for Chapter {chapter.chapter_number}: {content_result.get('error')}")
+                    # Create a basic section as fallback
+                    fallback_content = f"""## 第{chapter.chapter_number}章内容概述
+
+### 主要内容：
+本章将介绍{chapter.title}的核心概念和重要知识点。
+
+### 学习目标：
+通过本章学习，学员将能够：
+- 理解{chapter.title}的基本概念
+- 掌握相关的实践方法
+- 应用所学知识解决实际问题
+
+### 重点内容：
+1. **基础概念** - 介绍基本理论和定义
+2. **实践方法** - 学习具体的操作技能  
+3. **案例分析** - 通过实例深化理解
+4. **总结与展望** - 整合知识并展望发展"""
+                    
+                    section = Section(
+                        chapter_id=chapter.id,
+                        section_number=f"{chapter.chapter_number}.1",
+                        title=f"第{chapter.chapter_number}章内容概述",
+                        description=f"第{chapter.chapter_number}章 - {chapter.title}概述",
+                        content=fallback_content,
+                        estimated_minutes=60
+                    )
+                    db.add(section)
+                    
+            except Exception as e:
+                logger.error(f"Error generating content for Chapter {chapter.chapter_number}: {str(e)}")
+                # Create fallback section
+                error_fallback_content = f"""## 第{chapter.chapter_number}章内容
+
+### 内容生成状态：
+章节内容生成过程中遇到技术问题，系统正在处理中。
+
+### 临时内容：
+本章节将涵盖{chapter.title}相关的重要内容，包括：
+- 核心概念和理论基础
+- 实际应用和操作方法
+- 案例分析和最佳实践
+
+请稍后刷新页面查看完整内容，或联系管理员获取帮助。
+
+**错误信息：** {str(e)[:100]}..."""
+
+                section = Section(
+                    chapter_id=chapter.id,
+                    section_number=f"{chapter.chapter_number}.1",
+                    title=f"第{chapter.chapter_number}章内容",
+                    description=f"第{chapter.chapter_number}章 - 内容生成中",
+                    content=error_fallback_content,
+                    estimated_minutes=60
+                )
+                db.add(section)
+        
+        # Update course status
+        course.status = "published"
+        
+        # Commit all changes
+        db.commit()
+        clear_cache_namespace(COURSES_NAMESPACE)
+        logger.info(f"Course content generation completed for course {course_id}")
+        
+        # 发送完成通知
+        await send_completion_update(task_id, True, "课程生成完成！", course_id)
+        
+    except Exception as e:
+        error_msg = f"Course content generation error: {str(e)}"
+        logger.error(error_msg)
+        # 介绍或学习目标生成失败时章节结构调用尚未被等待：取消排队中的调用，并取走已结束调用的结果或异常
+        if structure_future is not None:
+            structure_future.cancel()
+            await asyncio.gather(structure_future, return_exceptions=True)
+        await send_error_update(task_id, error_msg)
+        db.rollback()
+        # Update course status to indicate error
+        try:
+            # 回滚只会使已加载的课程对象过期，直接复用，无需重新查询
+            if course is not None:
+                course.status = "failed"
+                db.commit()
+                clear_cache_namespace(COURSES_NAMESPACE)
+            await send_completion_update(task_id, False, f"课程生成失败: {error_msg}")
+        except Exception as commit_error:
+            logger.error(f"Failed to update course status: {commit_error}")
+    finally:
+        # 清理资源
+        db.close()
\ No newline at end of file
@@ -0,0 +1,60 @@
+"""
+Celery tasks for document processing
+"""
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.core.cache import DOCUMENTS_NAMESPACE, clear_cache_namespace
+from app.core.celery_app import celery_app
+from app.core.database import SessionLocal
+from app.models.document import Document
+
+@celery_app.task(name="documents.process")
+def process_document_task(document_id: int, file_path: str, file_type: str, file_hash: Optional[str] = None):
+    """Extract and store a document's content in a Celery worker"""
+    # 解析依赖（PyPDF2、pandas等）只在worker中导入；API进程导入本模块仅用于投递任务
+    from app.services.document_processor import DocumentProcessor
+    
+    db = SessionLocal()
+    document = None
+    try:
+        # Get document
+        document = db.query(Document).filter(Document.id == document_id).first()
+        if not document:
+            return
+        
+        # Update status and start time
+        document.status = "processing"
+        document.processing_started_at = datetime.now(timezone.utc)
+        db.commit()
+        
+        # Process document
+        processor = DocumentProcessor()
+        result = processor.process_document(file_path, file_type, file_hash)
+        
+        if result.get('success'):
+            document.raw_content = result.get('content', '')
+            document.processed_content = result.get('content', '')
+            document.doc_metadata = result.get('metadata') or {}
+            document.content_hash = result.get('file_hash', '')
+            document.status = "processed"
+            document.processing_completed_at = datetime.now(timezone.utc)
+        else:
+            document.status = "failed"
+            document.error_message = result.get('error', 'Unknown error')
+            document.retry_count += 1
+            document.processing_completed_at = datetime.now(timezone.utc)
+        
+        db.commit()
+    
+    except Exception as e:
+        db.rollback()
+        if document is not None:
+            document.status = "failed"
+            document.error_message = str(e)
+            document.retry_count += 1
+            document.processing_completed_at = datetime.now(timezone.utc)
+            db.commit()
+    finally:
+        db.close()
+        clear_cache_namespace(DOCUMENTS_NAMESPACE)